@@ -7,31 +7,42 @@ based on user requests.
 
 
 # --- Imports ---
+import hashlib
+import html
 import os
 import random
-import time
 import logging
+import operator
 import re
-import traceback
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import NamedTuple
 from flask import Flask, request, render_template, abort, Response
-from supabase import create_client
+from supabase import ClientOptions, PostgrestAPIError, create_client
 from user_agents import parse
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 from faker import Faker
+import lxml.etree
+import lxml.html
+import httpx
 
 # --- Load environment variables ---
 """ The dotenv file should contain:
 SUPABASE_URL=<your_supabase_url>
 SUPABASE_KEY=<your_supabase_key>
 IPINFO_TOKEN=<your_ipinfo_token>
+LOG_LEVEL=<optional_log_level>
 """
 load_dotenv()
 
 # --- Configuration ---
-""" Configure logging to output to console with timestamps and log level """
+""" Configure logging to output to console with timestamps and log level.
+The level is read from LOG_LEVEL (e.g. WARNING in production) and defaults to INFO."""
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
 # --- Global Variables ---
@@ -43,14 +54,32 @@ CONFIG = {
     "NUM_TEMPLATE_TYPES": 5,  # Corresponds to the number of H1 sections to use
     "TEMPLATES_PER_TYPE": 3,  # Corresponds to the number of H2 sections per H1
     "TOTAL_TEMPLATES": 15,  # Total number of unique combinations
-    "CACHE_DURATION_SECONDS": 600,
+    "CACHE_DURATION_SECONDS": 600,  # How often BOT_CACHE is reloaded from the database
     "FAKE_DATA_VAR_COUNT": 12,  # Number of fake data variables per type
+    "PAGE_CACHE_SIZE": 2048,  # Number of rendered (template, seed) pages to keep
+    "FAKE_DATA_CACHE_SIZE": 1024,  # Number of generated (type, seed) fake data tuples to keep
+    "BOT_CACHE_SIZE": 10000,  # Maximum number of bots kept in BOT_CACHE
+    "BOT_CACHE_TTL_SECONDS": 3600,  # How long a BOT_CACHE entry is trusted without a reload
+    "PAGE_MAX_AGE_SECONDS": 86400,  # How long bots and CDNs may reuse a served page
+    "DB_MAX_CONNECTIONS": 10,  # Open HTTP connections to Supabase per worker
+    "DB_KEEPALIVE_SECONDS": 30,  # Idle time before a pooled connection is closed
+    "DB_TIMEOUT_SECONDS": 120,  # Timeout for Supabase calls (supabase-py's own default)
 }
 
+""" CONFIG values read on the request path, bound once to module constants."""
+_TEMPLATES_PER_TYPE = CONFIG["TEMPLATES_PER_TYPE"]
+_TOTAL_TEMPLATES = CONFIG["TOTAL_TEMPLATES"]
+_PAGE_MAX_AGE_SECONDS = CONFIG["PAGE_MAX_AGE_SECONDS"]
+
 """ Cache for bot data to avoid frequent database queries.
-This cache stores the template ID and seed for each bot, along with a timestamp
-to determine if the cache is still valid based on CACHE_DURATION_SECONDS."""
-BOT_CACHE = {}
+This cache maps each bot name to its (expiry time, (template ID, seed)). The least
+recently used bots are evicted past BOT_CACHE_SIZE, and entries expire
+BOT_CACHE_TTL_SECONDS after they were last stored, measured on time.monotonic so
+clock adjustments do not affect them. The whole table is loaded at startup and
+reloaded every CACHE_DURATION_SECONDS by preload_bot_cache, which renews known bots
+before they expire. Access goes through BOT_CACHE_LOCK."""
+BOT_CACHE = OrderedDict()
+BOT_CACHE_LOCK = threading.RLock()
 
 """ A list of tuples defining the structure of fake data types.
 Each tuple contains a type name and a list of fields that can be generated."""
@@ -142,6 +171,89 @@ FAKE_DATA_TYPES = (
     ),
 )
 
+""" Precompiled regular expressions used while filling in templates.
+PLACEHOLDER_RE matches {field} placeholders, MATH_EXPR_RE matches math inside a
+numeric placeholder (e.g. {number + 23}) and WS_RE collapses whitespace in field names.
+PRONOUN_VARIANTS lists the {he}/{him}/{his}/{himself} pronoun placeholders, which
+PLACEHOLDER_RE also matches."""
+_PLACEHOLDER_RE = re.compile(r"\{([^}]+)\}")
+_MATH_EXPR_RE = re.compile(r"^([a-zA-Z0-9 _-]+)\s*([+\-*/])\s*([0-9.]+)$")
+_WS_RE = re.compile(r"\s+")
+_PRONOUN_VARIANTS = tuple(
+    variant
+    for key in ("he", "him", "his", "himself")
+    for variant in (key, key.capitalize(), key.upper())
+)
+
+""" Arithmetic operators supported inside numeric placeholders, e.g. {count * 4}."""
+_MATH_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+def normalize_field(field):
+    """Normalizes a field name or placeholder for matching.
+    
+    @param field: The field name to normalize.
+    @return: A normalized string suitable for matching.
+    """
+    # Lowercase and remove extra spaces for matching
+    return _WS_RE.sub(" ", field.strip().lower())
+
+
+""" For each type in FAKE_DATA_TYPES, a mapping of normalized field names to their
+index in the generated fake data tuple. Built once since FAKE_DATA_TYPES is static."""
+_FIELD_MAPS = tuple(
+    {
+        normalize_field(f if isinstance(f, str) else f[0]): i
+        for i, f in enumerate(fields)
+    }
+    for _, fields in FAKE_DATA_TYPES
+)
+
+
+def _build_head_map(field_map):
+    """Groups a field map by the first word of each field name.
+    Each head word maps to its (field_key, index) pairs in field_map order.
+
+    @param field_map: A mapping of normalized field names to their fake data index.
+    @return: A dictionary of head word to a tuple of (field_key, index) pairs.
+    """
+    head_map = {}
+    for field_key, idx in field_map.items():
+        head_map.setdefault(field_key.split(" ", 1)[0], []).append((field_key, idx))
+    return {head: tuple(candidates) for head, candidates in head_map.items()}
+
+
+""" For each type in FAKE_DATA_TYPES, the field map grouped by head word, so a
+placeholder such as {location (city)} only checks the fields starting with 'location'."""
+_HEAD_MAPS = tuple(_build_head_map(field_map) for field_map in _FIELD_MAPS)
+
+
+def find_field_index(type_index: int, norm_placeholder: str):
+    """
+    Finds the index in the fake data tuple that a normalized placeholder refers to.
+    A placeholder matches a field when it equals or starts with the field name.
+
+    @param type_index: Index of the type in FAKE_DATA_TYPES the placeholder belongs to.
+    @param norm_placeholder: The placeholder text, normalized with normalize_field.
+    @return: The index into the fake data tuple, or None if no field matches.
+    """
+    head = norm_placeholder.split(" ", 1)[0]
+    for field_key, idx in _HEAD_MAPS[type_index].get(head, ()):
+        if norm_placeholder.startswith(field_key):
+            return idx
+
+    # Fall back to a full scan for placeholders such as {years},
+    # whose head word only starts with a field name
+    for field_key, idx in _FIELD_MAPS[type_index].items():
+        if norm_placeholder.startswith(field_key):
+            return idx
+    return None
+
 
 # --- HTML Parsing and Content Generation Functions ---
 def parse_master_html(html_content):
@@ -150,46 +262,117 @@ def parse_master_html(html_content):
     The structure is:
     {
         "H1 Title": {
-            "H2 Title 1": <H2 content>,
-            "H2 Title 2": <H2 content>,
+            "H2 Title 1": "<H2 content HTML>",
+            "H2 Title 2": "<H2 content HTML>",
             ...
         },
         ...
     }
 
+    The result is memoized on the HTML content, so parsing the same master file
+    again returns the already-built structure.
+
     @param html_content: The HTML content as a string.
     @return: A nested dictionary structure containing H1 and H2 sections.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    return _parse_master_html_cached(html_content)
+
+
+""" Parsed master files, keyed by (path, mtime, size), so loading an unchanged
+file again skips both reading and parsing it."""
+_PARSED_CACHE = {}
+
+
+def load_nested_sections(path="FakeData.html"):
+    """
+    Reads and parses a master HTML file with parse_master_html.
+    The result is cached until the file's modification time or size changes.
+
+    @param path: The path to the master HTML file.
+    @return: A nested dictionary structure containing H1 and H2 sections.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    nested = _PARSED_CACHE.get(key)
+    if nested is None:
+        with open(path, "r", encoding="utf-8") as f:
+            nested = parse_master_html(f.read())
+        _PARSED_CACHE.clear()
+        _PARSED_CACHE[key] = nested
+    return nested
+
+
+""" lxml parser for the master file. Comments and processing instructions are never
+part of a section, so they are dropped while the tree is built instead of being
+created and skipped or serialized afterwards."""
+_MASTER_HTML_PARSER = lxml.html.HTMLParser(remove_comments=True, remove_pis=True)
+
+
+@lru_cache(maxsize=4)
+def _parse_master_html_cached(html_content: str):
+    """Builds the nested H1/H2 structure for parse_master_html.
+    Walks an lxml tree directly, since only headings, their text and the raw HTML
+    between them are needed; this keeps the whole parse in lxml's C code.
+
+    @param html_content: The HTML content as a string.
+    @return: A nested dictionary structure containing H1 and H2 sections.
+    """
+    # The master file is always a full document, so skip fromstring's fragment sniffing
+    root = lxml.html.document_fromstring(html_content, parser=_MASTER_HTML_PARSER)
     nested_data = {}
 
-    for h1 in soup.find_all("h1"):
-        h1_title = h1.get_text(strip=True)
-        h2_sections = {}
-
-        h1_content_soup = BeautifulSoup("", "html.parser")
-        for sibling in h1.find_next_siblings():
-            if sibling.name == "h1":  # type: ignore
-                break
-            h1_content_soup.append(sibling)
-
-        for h2 in h1_content_soup.find_all("h2"):
-            h2_title = h2.get_text(strip=True)
-            h2_content_soup = BeautifulSoup("", "html.parser")
-            for h2_sibling in h2.find_next_siblings():
-                if h2_sibling.name == "h2":  # type: ignore
-                    break
-                h2_content_soup.append(h2_sibling)
-            h2_sections[h2_title] = h2_content_soup
-
-        if h2_sections:
-            nested_data[h1_title] = h2_sections
+    first_h1 = next(root.iter("h1"), None)
+    if first_h1 is None:
+        return nested_data
+
+    # Walk the top-level tags once, collecting the raw HTML of each tag into the
+    # list for the current (H1, H2) pair. Content before the first H2 of a section
+    # is kept under the None key and only used when the section has no H2s.
+    sections = {}
+    h1_title = h2_title = None
+    for element in first_h1.getparent():  # type: ignore
+        if not isinstance(element.tag, str):
+            # Skip any remaining non-element nodes, such as entities
+            continue
+        if element.tag == "h1":
+            h1_title = _element_text(element)
+            h2_title = None
+            sections[h1_title] = {None: []}
+        elif h1_title is None:
+            continue
+        elif element.tag == "h2":
+            h2_title = _element_text(element)
+            sections[h1_title][h2_title] = []
+        else:
+            sections[h1_title][h2_title].append(
+                lxml.etree.tostring(
+                    element, encoding="unicode", method="html", with_tail=False
+                )
+            )
+
+    for h1_title, h2_parts in sections.items():
+        h1_parts = h2_parts.pop(None)
+        if h2_parts:
+            nested_data[h1_title] = {
+                h2_title: "".join(parts) for h2_title, parts in h2_parts.items()
+            }
         else:
-            nested_data[h1_title] = h1_content_soup
+            nested_data[h1_title] = "".join(h1_parts)
 
     return nested_data
 
 
+def _element_text(element):
+    """Returns an element's text with each piece stripped and joined together,
+    the same as BeautifulSoup's get_text(strip=True).
+
+    @param element: The lxml element to get the text of.
+    @return: The stripped text of the element.
+    """
+    return "".join(text.strip() for text in element.itertext())
+
+
 def get_content_from_nested_structure(nested_dict, num):
     """
     Selects and correctly reconstructs a specific H1 and H2 section based on the template number.
@@ -197,7 +380,7 @@ def get_content_from_nested_structure(nested_dict, num):
 
     @param nested_dict: The nested dictionary structure containing H1 and H2 sections.
     @param num: The template number to select content for.
-    @return: A BeautifulSoup object containing the selected H1 and H2 content.
+    @return: A tuple (h1_title, html) where html is the selected H1 and H2 content as a string.
     """
     top_keys = list(nested_dict.keys())
     if not top_keys:
@@ -207,7 +390,7 @@ def get_content_from_nested_structure(nested_dict, num):
 
     # Calculate which H1 section to use.
     # The formula (num - 1) // 3 gives us groups of 3 (0, 1, 2, 3, 4).
-    top_index_calc = (num - 1) // CONFIG["TEMPLATES_PER_TYPE"]
+    top_index_calc = (num - 1) // _TEMPLATES_PER_TYPE
 
     # Use modulo on the *actual number of available H1s* to prevent index errors.
     # If we need the 5th H1 but only 4 exist, this will wrap around to the 1st.
@@ -215,7 +398,7 @@ def get_content_from_nested_structure(nested_dict, num):
     top_key = top_keys[top_index]
 
     h1_section_content = nested_dict[top_key]
-    final_soup = BeautifulSoup(f"<h1>{top_key}</h1>", "html.parser")
+    parts = [f"<h1>{html.escape(top_key)}</h1>"]
 
     # Check if the h1 section has nested h2 sections
     if isinstance(h1_section_content, dict) and h1_section_content:
@@ -225,43 +408,206 @@ def get_content_from_nested_structure(nested_dict, num):
         if bottom_keys:
             # Calculate which H2 section to use within the H1.
             # The formula (num - 1) % 3 gives us the position within the group (0, 1, 2).
-            bottom_index_calc = (num - 1) % CONFIG["TEMPLATES_PER_TYPE"]
+            bottom_index_calc = (num - 1) % _TEMPLATES_PER_TYPE
 
             # Use modulo on the *actual number of H2s in this specific section*.
             # If we need the 3rd H2 but only 2 exist, this wraps to the 1st.
             bottom_index = bottom_index_calc % len(bottom_keys)
             bottom_key = bottom_keys[bottom_index]
 
-            final_soup.append(BeautifulSoup(f"<h2>{bottom_key}</h2>", "html.parser"))
-            final_soup.append(h1_section_content[bottom_key])
+            parts.append(f"<h2>{html.escape(bottom_key)}</h2>")
+            parts.append(h1_section_content[bottom_key])
         else:
             # If the dict is empty, treat it as direct content
             logging.warning(
-                f"H1 section '{top_key}' has empty H2 sections. Using fallback content."
-            )
-            final_soup.append(
-                BeautifulSoup("<p>Content not available.</p>", "html.parser")
+                "H1 section '%s' has empty H2 sections. Using fallback content.",
+                top_key,
             )
+            parts.append("<p>Content not available.</p>")
     else:
         # If no H2s, append the direct content of the H1 section.
         if h1_section_content:
-            if isinstance(h1_section_content, (BeautifulSoup, str)):
-                final_soup.append(h1_section_content)
+            if isinstance(h1_section_content, str):
+                parts.append(h1_section_content)
             else:
                 logging.warning(
-                    f"H1 section '{top_key}' content is not appendable. Using fallback."
-                )
-                final_soup.append(
-                    BeautifulSoup("<p>Content not available.</p>", "html.parser")
+                    "H1 section '%s' content is not appendable. Using fallback.",
+                    top_key,
                 )
+                parts.append("<p>Content not available.</p>")
         else:
             # Fallback if content is completely empty
-            logging.warning(f"H1 section '{top_key}' has no content. Using fallback.")
-            final_soup.append(
-                BeautifulSoup("<p>Content not available.</p>", "html.parser")
+            logging.warning("H1 section '%s' has no content. Using fallback.", top_key)
+            parts.append("<p>Content not available.</p>")
+
+    return top_key, "".join(parts)
+
+
+# --- Fake Data Generation ---
+""" A single Faker instance shared by all requests. Building Faker() loads every
+provider, so it is done once at import and reseeded per call instead.
+The lock keeps the seed-then-generate sequence deterministic under threaded servers."""
+_FAKER = Faker()
+_FAKER_LOCK = threading.Lock()
+
+""" Per-thread random generators for picking page seeds, so concurrent requests
+do not share (and contend on) the global random module state."""
+_LOCAL_RNG = threading.local()
+
+
+def _rand_seed() -> int:
+    """Returns a random non-zero seed from this thread's own random generator.
+
+    @return: A random integer between 1 and 2**31 - 1.
+    """
+    rng = getattr(_LOCAL_RNG, "rng", None)
+    if rng is None:
+        rng = _LOCAL_RNG.rng = random.Random()
+    return rng.randint(1, 2**31 - 1)
+
+
+class FakeName:
+    """A class to represent a fake name with first and last names.
+    It generates a full name from first and last names.
+    """
+    __slots__ = ("first_name", "last_name", "full_name")
+
+    def __init__(self, fake):
+        """Initialize with a Faker instance to generate names.
+        
+        @param fake: A Faker instance to generate names.
+        Generates first and last names, and combines them into a full name.
+        """
+        self.first_name = fake.first_name()
+        self.last_name = fake.last_name()
+        self.full_name = f"{self.first_name} {self.last_name}"
+
+    def __repr__(self):
+        return self.full_name
+
+
+class FakeLocation:
+    """A class to represent a fake location with city, country, continent, and address.
+    It generates a location object with these attributes."""
+    __slots__ = ("city", "country", "continent", "address")
+
+    def __init__(self, fake):
+        """Initialize with a Faker instance to generate location data.
+        
+        @param fake: A Faker instance to generate location data.
+        Generates city, country, continent, and address attributes.
+        """
+        self.city = fake.city()
+        self.country = fake.country()
+
+        # Since Faker does not provide continent directly,
+        # we randomly select a continent.
+        self.continent = fake.random_element(
+            elements=(
+                "Europe",
+                "Asia",
+                "Africa",
+                "North America",
+                "South America",
+                "Australia",
+                "Antarctica",
             )
+        )
+        self.address = fake.address()
+
+    def __repr__(self):
+        return f"{self.address} ({self.city}, {self.country}, {self.continent})"
+
+
+def _resolve_field_generator(field_name: str):
+    """
+    Resolves a field name from FAKE_DATA_TYPES to the callable that generates its value.
+    The keyword checks run once per field at import time instead of on every request.
+
+    @param field_name: The field name to resolve (e.g. 'birth location').
+    @return: A callable that takes a Faker instance and returns the generated value.
+    """
+    field_name = field_name.lower()
+
+    # If the field name contains "name" but not "company" or "product", generate a fake name
+    # This allows for more specific name generation, e.g., first and last names
+    # This is to avoid generating company names or product names when the field is just a name
+    if (
+        "name" in field_name
+        and "company" not in field_name
+        and "product" not in field_name
+    ):
+        return FakeName
+
+    # If the field name contains "company" or "brand", generate a fake company name
+    # This allows for more specific company generation, e.g., brand names or company names
+    elif "company" in field_name or "brand" in field_name:
+        return lambda fake: fake.company()
+
+    # If the field name contains "product", generate a fake product name
+    elif "product" in field_name:
+        return lambda fake: fake.word()
+
+    # If the field name contains "year", generate a random year
+    # If it contains "date", generate a random date object
+    elif "year" in field_name or "date" in field_name:
+        return lambda fake: fake.date_object()
+
+    # If the field name contains "location", "country", "city", or "continent",
+    # generate a fake location object with city, country, continent, and address
+    elif (
+        "location" in field_name
+        or "country" in field_name
+        or "city" in field_name
+        or "continent" in field_name
+    ):
+        # Return the whole location object for later use
+        return FakeLocation
+
+    # If the field name contains "email", generate a fake email address
+    elif "email" in field_name:
+        return lambda fake: fake.email()
+
+    # If the field name contains "phone", generate a fake phone number
+    elif "phone" in field_name:
+        return lambda fake: fake.phone_number()
+
+    # If the field name contains "number", "count",
+    # generate a random integer between 1 and 10000
+    elif "number" in field_name or "count" in field_name:
+        return lambda fake: fake.random_int(min=1, max=10000)
+
+    # If the field name contains "dollars" or "price", generate a fake decimal number
+    elif "dollars" in field_name or "price" in field_name:
+        return lambda fake: fake.pydecimal(left_digits=5, right_digits=2, positive=True)
+    elif "song" in field_name or "concert" in field_name or "collab" in field_name:
+        return lambda fake: fake.word()
+    elif "nickname" in field_name:
+        return lambda fake: fake.user_name()
+    elif "science field" in field_name:
+        return lambda fake: fake.job()
+    elif "prize" in field_name:
+        return lambda fake: fake.word() + " Prize"
+    elif "journal" in field_name:
+        return lambda fake: fake.word().capitalize() + " Journal"
+    elif "university" in field_name:
+        return lambda fake: fake.company() + " University"
+    elif "faction" in field_name:
+        return lambda fake: fake.word().capitalize() + " Faction"
+    else:
+        return lambda fake: fake.word()
+
 
-    return final_soup
+""" The generator callables for each type in FAKE_DATA_TYPES, in field order.
+Resolved once at import so generating fake data is a single pass over prepared callables."""
+_GENERATORS_BY_TYPE = tuple(
+    tuple(
+        # If there are multiple variations, pick the first for now
+        _resolve_field_generator(field if isinstance(field, str) else field[0])
+        for field in fields
+    )
+    for _, fields in FAKE_DATA_TYPES
+)
 
 
 def generate_fake_data_for_type(type_index: int, seed: int = 0):
@@ -276,287 +622,213 @@ def generate_fake_data_for_type(type_index: int, seed: int = 0):
     Raises ValueError if type_index is out of range.
     """
 
-    # Pick/generate seed
+    # Pick/generate seed; a random seed is one-off, so it skips the cache
     if seed == 0:
-        seed = random.randint(1, 2**31 - 1)
-    Faker.seed(seed)
-    fake = Faker()
+        seed = _rand_seed()
+        return {seed: _fake_tuple.__wrapped__(type_index, seed)}
 
-    type_name, fields = FAKE_DATA_TYPES[type_index]
-    result = []
+    return {seed: _fake_tuple(type_index, seed)}
 
-    for field_tuple in fields:
-        # If there are multiple variations, pick the first for now
-        field = field_tuple if isinstance(field_tuple, tuple) else (field_tuple,)
-        field_name = field[0].lower()
-
-        # Map field names to faker methods/objects
-
-        # Check if the field name contains specific keywords to determine the type of data to generate
-
-        # If the field name contains "name" but not "company" or "product", generate a fake name
-        # This allows for more specific name generation, e.g., first and last names
-        # This is to avoid generating company names or product names when the field is just a name
-        if (
-            "name" in field_name
-            and "company" not in field_name
-            and "product" not in field_name
-        ):
-
-            class FakeName:
-                """A class to represent a fake name with first and last names.
-                It generates a full name from first and last names.
-                """
-                def __init__(self, fake):
-                    """Initialize with a Faker instance to generate names.
-                    
-                    @param fake: A Faker instance to generate names.
-                    Generates first and last names, and combines them into a full name.
-                    """
-                    self.first_name = fake.first_name()
-                    self.last_name = fake.last_name()
-                    self.full_name = f"{self.first_name} {self.last_name}"
-
-                def __repr__(self):
-                    return self.full_name
-
-            result.append(FakeName(fake))
-        
-        # If the field name contains "company" or "brand", generate a fake company name
-        # This allows for more specific company generation, e.g., brand names or company names
-        elif "company" in field_name or "brand" in field_name:
-            result.append(fake.company())
-        
-        # If the field name contains "product", generate a fake product name
-        elif "product" in field_name:
-            result.append(fake.word())
-        
-        # If the field name contains "year", generate a random year
-        # If it contains "date", generate a random date object
-        elif "year" in field_name or "date" in field_name:
-            result.append(fake.date_object())
-        
-        # If the field name contains "location", "country", "city", or "continent",
-        # generate a fake location object with city, country, continent, and address
-        elif (
-            "location" in field_name
-            or "country" in field_name
-            or "city" in field_name
-            or "continent" in field_name
-        ):
-            # Return the whole location object for later use
-            class FakeLocation:
-                """A class to represent a fake location with city, country, continent, and address.
-                It generates a location object with these attributes."""
-                def __init__(self, fake):
-                    """Initialize with a Faker instance to generate location data.
-                    
-                    @param fake: A Faker instance to generate location data.
-                    Generates city, country, continent, and address attributes.
-                    """
-                    self.city = fake.city()
-                    self.country = fake.country()
-
-                    # Since Faker does not provide continent directly,
-                    # we randomly select a continent.
-                    self.continent = fake.random_element(
-                        elements=(
-                            "Europe",
-                            "Asia",
-                            "Africa",
-                            "North America",
-                            "South America",
-                            "Australia",
-                            "Antarctica",
-                        )
-                    )
-                    self.address = fake.address()
-
-                def __repr__(self):
-                    return f"{self.address} ({self.city}, {self.country}, {self.continent})"
-
-            result.append(FakeLocation(fake))
-        
-        # If the field name contains "email", generate a fake email address
-        elif "email" in field_name:
-            result.append(fake.email())
-        
-        # If the field name contains "phone", generate a fake phone number
-        elif "phone" in field_name:
-            result.append(fake.phone_number())
-        
-        # If the field name contains "number", "count",
-        # generate a random integer between 1 and 10000
-        elif "number" in field_name or "count" in field_name:
-            result.append(fake.random_int(min=1, max=10000))
-        
-        # If the field name contains "dollars" or "price", generate a fake decimal number
-        elif "dollars" in field_name or "price" in field_name:
-            result.append(fake.pydecimal(left_digits=5, right_digits=2, positive=True))
-        elif "song" in field_name or "concert" in field_name or "collab" in field_name:
-            result.append(fake.word())
-        elif "nickname" in field_name:
-            result.append(fake.user_name())
-        elif "science field" in field_name:
-            result.append(fake.job())
-        elif "prize" in field_name:
-            result.append(fake.word() + " Prize")
-        elif "journal" in field_name:
-            result.append(fake.word().capitalize() + " Journal")
-        elif "university" in field_name:
-            result.append(fake.company() + " University")
-        elif "faction" in field_name:
-            result.append(fake.word().capitalize() + " Faction")
-        else:
-            result.append(fake.word())
 
-    return {seed: tuple(result)}
+@lru_cache(maxsize=CONFIG["FAKE_DATA_CACHE_SIZE"])
+def _fake_tuple(type_index: int, seed: int):
+    """Generates and memoizes the fake data tuple for a type index and non-zero seed.
+    Reseeding Faker makes the output fully determined by these two values.
+    One-off random seeds call _fake_tuple.__wrapped__ so they do not push reusable
+    entries out of the cache.
+    The cached objects are shared between callers and must not be modified.
+
+    @param type_index: Index of the type in FAKE_DATA_TYPES to generate data for.
+    @param seed: The seed for Faker to generate consistent data.
+    @return: A tuple of generated fake data objects.
+    """
+    generators = _GENERATORS_BY_TYPE[type_index]
+
+    with _FAKER_LOCK:
+        _FAKER.seed_instance(seed)
+        return tuple(generator(_FAKER) for generator in generators)
 
 
-def stringify_fake_datum(fake_datum, type: str):
+def _str_location(fake_datum, type: str):
+    """Returns the part of a FakeLocation a location placeholder asks for.
+
+    @param fake_datum: The FakeLocation to convert.
+    @param type: The placeholder text, e.g. 'location (city)'.
+    @return: The city, country, continent or address as a string.
     """
-    Converts a fake datum to a string based on its type.
-    Handles complex types like location and returns a formatted string.
+    if "city" in type:
+        return fake_datum.city
+    elif "country" in type:
+        return fake_datum.country
+    elif "continent" in type:
+        return fake_datum.continent
+    else:
+        return str(fake_datum.address)
 
-    @param fake_datum: The fake data object to convert.
-    @param type: The type of data to convert to string
-    @return: A string representation of the fake datum.
+
+def _str_name(fake_datum, type: str):
+    """Returns the part of a FakeName a name placeholder asks for.
+
+    @param fake_datum: The FakeName to convert.
+    @param type: The placeholder text, e.g. 'name (last name)'.
+    @return: The first, last or full name.
     """
+    if "last" in type:
+        return fake_datum.last_name
+    elif "first" in type:
+        return fake_datum.first_name
+    else:
+        return fake_datum.full_name
 
-    # If the type is a location then return the appropriate part of the location
-    if type.startswith("location"):
-        if "city" in type:
-            return fake_datum.city
-        elif "country" in type:
-            return fake_datum.country
-        elif "continent" in type:
-            return fake_datum.continent
-        else:
-            return str(fake_datum.address)
-    
-    # If the type is a name, return the appropriate part of the name
-    elif type.startswith("name"):
-        if "last" in type:
-            return fake_datum.last_name
-        elif "first" in type:
-            return fake_datum.first_name
-        else:
-            return fake_datum.full_name
-    
-    # If the type is a numeric type, handle math expressions or return as string
-    elif (
-        type.startswith("number")
-        or type.startswith("count")
-        or type.startswith("dollars")
-        or type.startswith("price")
-    ):
-        # Support math in placeholder, e.g. {number + 23}, {count * 4}
-        math_expr = re.match(r"^([a-zA-Z0-9 _-]+)\s*([\+\-\*/])\s*([0-9\.]+)$", type)
-        if math_expr:
-            op = math_expr.group(2)
-            operand = math_expr.group(3)
-            try:
-                value = float(fake_datum)
-                expr = f"{value} {op} {operand}"
-                result = eval(expr)
-                if isinstance(result, float) and result.is_integer():
-                    return str(int(result))
-                return str(result)
-            except Exception:
-                print(f"Error #1")
-                traceback.print_exc()
-                return str(fake_datum)
-        return str(fake_datum)
 
-    # If the type is a date, format it as 'nth of Month YYYY'
-    elif type.startswith("date"):
-        # Format date as 'nth of Month YYYY'
-        if isinstance(fake_datum, (str, int)):
+def _str_numeric(fake_datum, type: str):
+    """Returns a numeric datum as a string, applying any math in the placeholder.
+
+    @param fake_datum: The number to convert.
+    @param type: The placeholder text, e.g. 'number + 23' or 'count * 4'.
+    @return: The (possibly computed) number as a string.
+    """
+    # Support math in placeholder, e.g. {number + 23}, {count * 4}
+    math_expr = _MATH_EXPR_RE.match(type)
+    if math_expr:
+        op = math_expr.group(2)
+        operand = math_expr.group(3)
+        try:
+            result = _MATH_OPS[op](float(fake_datum), float(operand))
+        except (ValueError, ZeroDivisionError):
             return str(fake_datum)
+        if result.is_integer():
+            return str(int(result))
+        return str(result)
+    return str(fake_datum)
 
-        def ordinal(n):
-            return "%d%s" % (
-                n,
-                "tsnrhtdd"[(n // 10 % 10 != 1) * (n % 10 < 4) * n % 10 :: 4],
-            )
 
-        return f"{ordinal(fake_datum.day)} of {fake_datum.strftime('%B %Y')}"
-    
-    # If the type is a year, return the year as a string
-    elif type.startswith("year"):
-        # Return year as a string
-        if isinstance(fake_datum, (str, int)):
-            return str(fake_datum)
-        return str(fake_datum.year)
-    else:
+def _str_date(fake_datum, _type: str):
+    """Formats a date datum as 'nth of Month YYYY'.
+
+    @param fake_datum: The date to convert.
+    @param _type: The placeholder text (unused).
+    @return: The formatted date.
+    """
+    if isinstance(fake_datum, (str, int)):
         return str(fake_datum)
 
+    def ordinal(n):
+        return "%d%s" % (
+            n,
+            "tsnrhtdd"[(n // 10 % 10 != 1) * (n % 10 < 4) * n % 10 :: 4],
+        )
 
-def generate_complete_template(template_number: int, templates, seed: int = 0):
+    return f"{ordinal(fake_datum.day)} of {fake_datum.strftime('%B %Y')}"
+
+
+def _str_year(fake_datum, _type: str):
+    """Returns the year of a date datum as a string.
+
+    @param fake_datum: The date to convert.
+    @param _type: The placeholder text (unused).
+    @return: The year.
     """
-    Generates a complete HTML template based on the template number and seed.
-    Returns a string of HTML content.
-    Replaces placeholders like {name}, {location (city)}, etc. with generated fake data.
+    if isinstance(fake_datum, (str, int)):
+        return str(fake_datum)
+    return str(fake_datum.year)
+
+
+def _str_default(fake_datum, _type: str):
+    """Returns any other datum as a plain string."""
+    return str(fake_datum)
+
+
+""" Stringifiers keyed by the first word of a placeholder. The ordered prefix tuple
+covers placeholders whose first word only starts with a key, e.g. {years}.
+All of them take (fake_datum, type); those that ignore the type name it _type."""
+_STRINGIFIERS = {
+    "location": _str_location,
+    "name": _str_name,
+    "number": _str_numeric,
+    "count": _str_numeric,
+    "dollars": _str_numeric,
+    "price": _str_numeric,
+    "date": _str_date,
+    "year": _str_year,
+}
+_STRINGIFIER_PREFIXES = tuple(_STRINGIFIERS.items())
 
-    @param template_number: The number of the template to generate.
-    @param templates: The nested dictionary structure containing H1 and H2 sections.
-    @param seed: The seed for Faker to generate consistent data. If 0, a random seed is generated.
-    @return: A string of HTML content with placeholders replaced by fake data.
+
+def stringify_fake_datum(fake_datum, type: str):
     """
+    Converts a fake datum to a string based on its type.
+    Handles complex types like location and returns a formatted string.
 
-    def pronouns_helper(pronoun_type: str, seed: int):
-        """
-        Given a male pronoun form (e.g., 'he', 'Him', 'His'), use the seed to select
-        male, female, or they/them, and return the correct pronoun with preserved case.
+    @param fake_datum: The fake data object to convert.
+    @param type: The type of data to convert to string
+    @return: A string representation of the fake datum.
+    """
+    stringifier = _STRINGIFIERS.get(type.split(" ", 1)[0])
+    if stringifier is None:
+        stringifier = next(
+            (func for prefix, func in _STRINGIFIER_PREFIXES if type.startswith(prefix)),
+            _str_default,
+        )
+    return stringifier(fake_datum, type)
 
-        @param pronoun_type: The pronoun type to convert (e.g., 'he', 'Him', 'His').
-        @param seed: The seed to determine which pronoun set to use.
-        @return: The converted pronoun with preserved case.
-        """
-        # Define pronoun sets
-        pronoun_sets = {
-            "male": {
-                "he": "he",
-                "him": "him",
-                "his": "his",
-                "himself": "himself",
-            },
-            "female": {
-                "he": "she",
-                "him": "her",
-                "his": "her",
-                "himself": "herself",
-            },
-            "they": {
-                "he": "they",
-                "him": "them",
-                "his": "their",
-                "himself": "themself",
-            },
-        }
 
-        # Normalize input to lowercase for lookup
-        base = pronoun_type.lower()
-        # Pick which set to use based on seed
-        choice = ["male", "female", "they"][seed % 3]
-        pronoun = pronoun_sets[choice].get(base, base)
-
-        # Preserve case
-        if pronoun_type.islower():
-            return pronoun
-        elif pronoun_type.istitle():
-            return pronoun.capitalize()
-        elif pronoun_type.isupper():
-            return pronoun.upper()
+class PreparedTemplate(NamedTuple):
+    """A template number resolved ahead of time to everything that does not depend
+    on the seed: the fake data type it uses and its HTML body compiled into segments
+    by compile_template_body."""
+    type_index: int
+    segments: tuple
+
+
+def compile_template_body(type_index: int, body_html: str) -> tuple:
+    """
+    Splits a template body into the segments render_prepared_body joins together.
+    Each segment is either a literal string, ("pronoun", variant) for a pronoun
+    placeholder, or ("field", index, placeholder) for a fake data placeholder.
+    Placeholders that match no field are kept in the literal text as they are.
+
+    @param type_index: Index of the type in FAKE_DATA_TYPES the template uses.
+    @param body_html: The template's HTML body.
+    @return: A tuple of segments.
+    """
+    segments = []
+    literal = []
+    last_end = 0
+    for match in _PLACEHOLDER_RE.finditer(body_html):
+        literal.append(body_html[last_end : match.start()])
+        last_end = match.end()
+
+        placeholder = match.group(1)
+        if placeholder in _PRONOUN_VARIANTS:
+            segment = ("pronoun", placeholder)
         else:
-            # Mixed or unknown case, fallback to original casing
-            return pronoun
+            idx = find_field_index(type_index, normalize_field(placeholder))
+            if idx is None:
+                literal.append(match.group(0))
+                continue
+            segment = ("field", idx, placeholder)
+
+        if literal:
+            segments.append("".join(literal))
+            literal = []
+        segments.append(segment)
+
+    literal.append(body_html[last_end:])
+    segments.append("".join(literal))
+    return tuple(segment for segment in segments if segment)
 
-    # Check if a seed is provided, if not generate a random one
-    if seed == 0:
-        seed = random.randint(1, 2**31 - 1)
 
-    if template_number < 1 or template_number > CONFIG["TOTAL_TEMPLATES"]:
+def prepare_template(templates, template_number: int) -> PreparedTemplate:
+    """
+    Resolves a template number to its fake data type and HTML body.
+
+    @param templates: The nested dictionary structure containing H1 and H2 sections.
+    @param template_number: The number of the template to prepare.
+    @return: The PreparedTemplate for the template number.
+    Raises ValueError if template_number is out of range.
+    """
+    if template_number < 1 or template_number > _TOTAL_TEMPLATES:
         raise ValueError(
             "Invalid template number: must be between 1 and TOTAL_TEMPLATES."
         )
@@ -564,227 +836,246 @@ def generate_complete_template(template_number: int, templates, seed: int = 0):
         n = template_number - 1
 
     # Determine which type of data to generate
-    type_index = n // CONFIG["TEMPLATES_PER_TYPE"]
+    type_index = n // _TEMPLATES_PER_TYPE
     if type_index >= len(FAKE_DATA_TYPES):
         raise ValueError("Invalid template number: exceeds available types.")
 
-    # Generate fake data for the selected type
-    fake_data = generate_fake_data_for_type(type_index, seed)
-    fake_tuple = fake_data[seed]
-    field_names = FAKE_DATA_TYPES[type_index][1]
-
-    # Create the HTML content
-    final_soup = get_content_from_nested_structure(templates, template_number)
-    template = (
-        final_soup.h1.get_text(strip=True), # type: ignore
-        str(final_soup),
-    )  # mimic the (h1, content) format
-    html_content = ""
-
-    # Prepare a mapping from normalized field names to their index in fake_tuple
-    def normalize_field(field):
-        """Normalizes a field name for matching.
-        
-        @param field: The field name to normalize.
-        @return: A normalized string suitable for matching.
-        """
-        # Lowercase and remove extra spaces for matching
-        return re.sub(r"\s+", " ", field.strip().lower())
+    # Select the HTML content as an (h1, content) pair; pages use a fixed title
+    _, body_html = get_content_from_nested_structure(templates, template_number)
+    return PreparedTemplate(type_index, compile_template_body(type_index, body_html))
 
-    # Create a mapping of normalized field names to their index in the fake_tuple
-    field_map = {
-        normalize_field(f if isinstance(f, str) else f[0]): i
-        for i, f in enumerate(field_names)
-    }
 
-    # Replace placeholders in the template body
-    def replace_placeholder(match):
-        """Replaces a placeholder in the template with the corresponding fake data.
-        
-        @param match: The regex match object containing the placeholder.
-        @return: The replacement string for the placeholder.
-        """
-        placeholder = match.group(1)
-        norm_placeholder = normalize_field(placeholder)
-        # Try to find the best match in field_map
-        for field_key in field_map:
-            if norm_placeholder == field_key or norm_placeholder.startswith(field_key):
-                idx = field_map[field_key]
-                return stringify_fake_datum(fake_tuple[idx], placeholder)
-        # If not found, just return the original placeholder
-        return match.group(0)
-
-    # Replace all {field} in the template body (template[1] or template[1:])
-    if len(template) > 1:
-        body = "".join(template[1:])  # In case template is a tuple/list of lines
-        html_content += re.sub(r"\{([^}]+)\}", replace_placeholder, body)
-
-    # Apply pronouns replacement using pure Python (no regex)
-    pronoun_keys = ["he", "him", "his", "himself"]
-
-    # Add pronouns to the HTML content
-    for key in pronoun_keys:
-        for variant in [key, key.capitalize(), key.upper()]:
-            placeholder = "{" + variant + "}"
-            replacement = pronouns_helper(variant, int(seed))
-            html_content = html_content.replace(placeholder, replacement)
-
-    soup = BeautifulSoup(html_content, "html.parser")
-    return wrap_soup_in_homepage(soup, title="Template")
+def prepare_templates(templates) -> tuple[PreparedTemplate, ...]:
+    """
+    Prepares every template number from 1 to TOTAL_TEMPLATES.
+    Done once at startup so serving a page only generates and fills in fake data.
 
+    @param templates: The nested dictionary structure containing H1 and H2 sections.
+    @return: A tuple of PreparedTemplate objects, indexed by template number - 1.
+    """
+    return tuple(
+        prepare_template(templates, template_number)
+        for template_number in range(1, _TOTAL_TEMPLATES + 1)
+    )
 
-# --- HTML Structure and Template Generation ---
-def split_html_by_tag(html_content, tag_name):
-    """Splits the HTML content into sections based on the specified tag name.
-    Each section is a dictionary with the tag's text as the key and the section's HTML as the value.
-    
-    @param html_content: The HTML content as a string.
-    @param tag_name: The name of the tag to split by (e.g., 'h1', 'h2').
-    @return: A dictionary where keys are the tag's text and values are BeautifulSoup objects
-    containing the section's HTML.
+
+""" The pronoun sets a seed can pick, in seed % 3 order. Each maps the male form
+used in the template placeholders to the pronoun that replaces it."""
+_PRONOUN_SETS = (
+    # male
+    {"he": "he", "him": "him", "his": "his", "himself": "himself"},
+    # female
+    {"he": "she", "him": "her", "his": "her", "himself": "herself"},
+    # they
+    {"he": "they", "him": "them", "his": "their", "himself": "themself"},
+)
+
+
+def pronouns_helper(pronoun_type: str, seed: int):
+    """
+    Given a male pronoun form (e.g., 'he', 'Him', 'His'), use the seed to select
+    male, female, or they/them, and return the correct pronoun with preserved case.
+
+    @param pronoun_type: The pronoun type to convert (e.g., 'he', 'Him', 'His').
+    @param seed: The seed to determine which pronoun set to use.
+    @return: The converted pronoun with preserved case.
     """
+    # Normalize input to lowercase for lookup
+    base = pronoun_type.lower()
+    # Pick which set to use based on seed
+    pronoun = _PRONOUN_SETS[seed % 3].get(base, base)
+
+    # Preserve case
+    if pronoun_type.islower():
+        return pronoun
+    elif pronoun_type.istitle():
+        return pronoun.capitalize()
+    elif pronoun_type.isupper():
+        return pronoun.upper()
+    else:
+        # Mixed or unknown case, fallback to original casing
+        return pronoun
 
-    # Parse the HTML content and find all tags of the specified type
-    soup = BeautifulSoup(html_content, "html.parser")
-    tags = soup.find_all(tag_name)
-    all_elements = list(soup.descendants)
 
-    sections = {}
+""" Every pronoun placeholder variant resolved for each pronoun set, indexed by
+seed % 3, so rendering a page only picks a table."""
+_PRONOUN_TABLES = tuple(
+    {variant: pronouns_helper(variant, set_index) for variant in _PRONOUN_VARIANTS}
+    for set_index in range(len(_PRONOUN_SETS))
+)
+
+
+def render_prepared_body(template: PreparedTemplate, seed: int = 0):
+    """
+    Fills a prepared template with fake data for the seed.
+    Replaces placeholders like {name}, {location (city)}, etc. with generated fake data.
+
+    @param template: The PreparedTemplate to render.
+    @param seed: The seed for Faker to generate consistent data. If 0, a random seed is generated.
+    @return: A string of HTML content with placeholders replaced by fake data.
+    """
 
-    # Iterate through the tags and extract the HTML content between them
-    for i, tag in enumerate(tags):
-        tag_index = all_elements.index(tag)
-        if i + 1 < len(tags):
-            next_tag = tags[i + 1]
-            next_tag_index = all_elements.index(next_tag)
+    type_index = template.type_index
+
+    # Check if a seed is provided, if not generate a random one.
+    # Generate fake data for the selected type; random seeds are not worth caching
+    if seed == 0:
+        seed = _rand_seed()
+        fake_tuple = _fake_tuple.__wrapped__(type_index, seed)
+    else:
+        fake_tuple = generate_fake_data_for_type(type_index, seed)[seed]
+
+    # Pick the precomputed pronoun replacements for this seed
+    pronoun_replacements = _PRONOUN_TABLES[int(seed) % 3]
+
+    # Join the precompiled segments, filling in pronouns and fake data
+    parts = []
+    for segment in template.segments:
+        if isinstance(segment, str):
+            parts.append(segment)
+        elif segment[0] == "pronoun":
+            parts.append(pronoun_replacements[segment[1]])
         else:
-            next_tag_index = len(all_elements)
-        section_html = "".join(
-            str(elem) for elem in all_elements[tag_index + 1 : next_tag_index]
-        )
-        section_soup = BeautifulSoup(section_html, "html.parser")
-        section_name = tag.get_text(strip=True)
-        sections[section_name] = section_soup
-    return sections
+            _, idx, placeholder = segment
+            parts.append(stringify_fake_datum(fake_tuple[idx], placeholder))
+    return "".join(parts)
 
 
-def wrap_soup_in_homepage(soup, title="Home"):
-    """    Wraps the provided BeautifulSoup object in a full HTML template with a header and footer.
-    
-    @param soup: The BeautifulSoup object to wrap.
-    @param title: The title of the page to be used in the HTML head.
-    @return: A string containing the full HTML template with the provided soup content.
+def render_prepared_template(template: PreparedTemplate, seed: int = 0):
+    """
+    Fills a prepared template with fake data for the seed and wraps it in the homepage.
+
+    @param template: The PreparedTemplate to render.
+    @param seed: The seed for Faker to generate consistent data. If 0, a random seed is generated.
+    @return: A string containing the full HTML page.
+    """
+    return wrap_soup_in_homepage(render_prepared_body(template, seed), title="Template")
+
+
+def generate_complete_template(template_number: int, templates, seed: int = 0):
+    """
+    Generates a complete HTML template based on the template number and seed.
+    Returns a string of HTML content.
+    Replaces placeholders like {name}, {location (city)}, etc. with generated fake data.
+
+    @param template_number: The number of the template to generate.
+    @param templates: The nested dictionary structure containing H1 and H2 sections.
+    @param seed: The seed for Faker to generate consistent data. If 0, a random seed is generated.
+    @return: A string of HTML content with placeholders replaced by fake data.
     """
+    return render_prepared_template(prepare_template(templates, template_number), seed)
 
 
-    html_template = f"""
-<!DOCTYPE html>
+# --- HTML Structure and Template Generation ---
+""" The static parts of the page built by wrap_soup_in_homepage.
+They are assembled once at import so rendering a page only joins strings;
+_PAGE_PREFIX_FMT takes the page title as its single %s argument."""
+_PAGE_PREFIX_FMT = """<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
-    <title>{title}</title>
+    <title>%s</title>"""
+_PAGE_MIDDLE = """
     <meta name="viewport" content="width=device-width, initial-scale=1">
     <style>
-        body {{
+        body {
             font-family: 'Segoe UI', Arial, sans-serif;
             background: #f8f9fa;
             margin: 0;
             padding: 0;
-        }}
-        .container {{
+        }
+        .container {
             max-width: 900px;
             margin: 40px auto;
             background: #fff;
             border-radius: 12px;
             box-shadow: 0 4px 24px rgba(0,0,0,0.08);
             padding: 32px 40px;
-        }}
-        h1, h2, h3 {{
+        }
+        h1, h2, h3 {
             color: #2c3e50;
             margin-top: 1.5em;
-        }}
-        h1 {{
+        }
+        h1 {
             border-bottom: 2px solid #3498db;
             padding-bottom: 0.3em;
-        }}
-        h2 {{
+        }
+        h2 {
             border-left: 4px solid #3498db;
             padding-left: 0.5em;
             margin-top: 1.2em;
-        }}
-        p {{
+        }
+        p {
             color: #444;
             line-height: 1.7;
-        }}
-        ul, ol {{
+        }
+        ul, ol {
             margin-left: 2em;
-        }}
-        a {{
+        }
+        a {
             color: #3498db;
             text-decoration: none;
-        }}
-        a:hover {{
+        }
+        a:hover {
             text-decoration: underline;
-        }}
-        @media (max-width: 600px) {{
-            .container {{
+        }
+        @media (max-width: 600px) {
+            .container {
                 padding: 16px 8px;
-            }}
-        }}
+            }
+        }
     </style>
 </head>
 <body>
     <div class="container">
-        {soup.prettify()}
+        """
+_PAGE_SUFFIX = """
     </div>
 </body>
 </html>
 """
-    return html_template
 
 
-def get_template(dic, num):
+def wrap_soup_in_homepage(body_html, title="Home"):
+    """    Wraps the provided HTML fragment in a full HTML template with a header and footer.
+    
+    @param body_html: The pre-rendered HTML fragment to wrap.
+    @param title: The title of the page to be used in the HTML head.
+    @return: A string containing the full HTML template with the provided content.
     """
-    Selects and returns a value from the nested dictionary based on num.
+    return _PAGE_PREFIX_FMT % title + _PAGE_MIDDLE + body_html + _PAGE_SUFFIX
 
-    The dictionary structure is expected to be:
-    {
-        "H1 Title": {
-            "H2 Title 1": <H2 content>,
-            "H2 Title 2": <H2 content>,
-            ...
-        },
-        ...
-    }
 
-    @param dic: The nested dictionary structure containing H1 and H2 sections.
-    @param num: The template number to select content for.
-    @return: The selected H2 content as a BeautifulSoup object.
-    Raises ValueError if num is out of range.
-    """
-    global CONFIG
+""" The same page parts pre-encoded for bot responses, with one prefix per page title,
+so serving a page only joins three bytes objects."""
+_PAGE_PREFIX_BYTES = {
+    title: (_PAGE_PREFIX_FMT % title + _PAGE_MIDDLE).encode("utf-8")
+    for title in ("Home", "Template")
+}
+_PAGE_SUFFIX_BYTES = _PAGE_SUFFIX.encode("utf-8")
 
-    top_keys = list(dic.keys())
-    top_index = num % CONFIG["NUM_TEMPLATE_TYPES"]
-    top_key = top_keys[top_index]
 
-    bottom_keys = list(dic[top_key].keys())
-    bottom_index = num % CONFIG["TEMPLATES_PER_TYPE"]
-    bottom_key = bottom_keys[bottom_index]
+def wrap_page_bytes(body_html, title="Template"):
+    """    Wraps the provided HTML fragment in the homepage like wrap_soup_in_homepage,
+    returning the page encoded as UTF-8 bytes.
 
-    return dic[top_key][bottom_key]
+    @param body_html: The pre-rendered HTML fragment to wrap.
+    @param title: The page title, one of the titles in _PAGE_PREFIX_BYTES.
+    @return: The full HTML page encoded as UTF-8 bytes.
+    """
+    return _PAGE_PREFIX_BYTES[title] + body_html.encode("utf-8") + _PAGE_SUFFIX_BYTES
 
 
-def generate_html_from_template_number(n):
-    """ Generates a full HTML page from a template number.
-    This function is used to generate the homepage with a specific template.
-    
-    @param n: The template number to generate the HTML for.
-    @return: A string containing the full HTML page.
-    Raises ValueError if n is out of range.
+def _check_template_number(template_number):
+    """Raises ValueError unless template_number names one of PREPARED_TEMPLATES.
+    Run before the memoized page helpers, which index PREPARED_TEMPLATES directly.
+
+    @param template_number: The template number to check.
     """
-    global nested_sections
-    return wrap_soup_in_homepage(get_template(nested_sections, n - 1), title="Home")
+    if not 1 <= template_number <= len(PREPARED_TEMPLATES):
+        raise ValueError(
+            "Invalid template number: must be between 1 and TOTAL_TEMPLATES."
+        )
 
 
 def generate_page_for_bot(template_number, seed=0):
@@ -793,66 +1084,240 @@ def generate_page_for_bot(template_number, seed=0):
     @param template_number: The template number to generate the HTML for.
     @param seed: The seed for Faker to generate consistent data. If 0, a
     random seed is generated.
-    @return: A string containing the full HTML page for the bot.
+    @return: The full HTML page for the bot, encoded as UTF-8 bytes.
+    """
+    _check_template_number(template_number)
+    if seed == 0:
+        # A random seed gives a one-off page, so there is nothing worth caching
+        template = PREPARED_TEMPLATES[template_number - 1]
+        return wrap_page_bytes(render_prepared_body(template))
+    return _generate_page_for_bot_cached(template_number, seed)
+
+
+@lru_cache(maxsize=CONFIG["PAGE_CACHE_SIZE"])
+def _generate_page_for_bot_cached(template_number, seed):
+    """Renders and memoizes the bot page for a template number and seed.
+    The output is fully determined by these two values, so returning bots skip the
+    Faker and template work. Pages are kept already encoded so the response body
+    is not re-encoded on every hit. Call cache_clear() whenever PREPARED_TEMPLATES
+    is rebuilt.
+
+    @param template_number: The template number to generate the HTML for.
+    @param seed: The non-zero seed for Faker to generate consistent data.
+    @return: The full HTML page for the bot, encoded as UTF-8 bytes.
+    """
+    template = PREPARED_TEMPLATES[template_number - 1]
+    return wrap_page_bytes(render_prepared_body(template, seed))
+
+
+def bot_page_etag(template_number, seed):
+    """Builds the strong ETag for a bot page from a hash of its rendered bytes, so
+    the tag changes whenever the page does, including after template edits or a
+    Faker upgrade.
+
+    @param template_number: The template number of the page.
+    @param seed: The seed of the page.
+    @return: The ETag value, or None for seed 0, whose pages are random.
+    """
+    _check_template_number(template_number)
+    if seed == 0:
+        return None
+    return _bot_page_etag_cached(template_number, seed)
+
+
+@lru_cache(maxsize=CONFIG["PAGE_CACHE_SIZE"])
+def _bot_page_etag_cached(template_number, seed):
+    """Memoized hash of the page served for a non-zero seed. Call cache_clear()
+    together with _generate_page_for_bot_cached.
+
+    @param template_number: The template number of the page.
+    @param seed: The non-zero seed of the page.
+    @return: The ETag value.
     """
-    global nested_sections
-    return generate_complete_template(template_number, nested_sections, seed=seed)
+    page = _generate_page_for_bot_cached(template_number, seed)
+    return hashlib.blake2b(page, digest_size=8).hexdigest()
 
 
 # --- Bot/DB Helper Functions (MODIFIED) ---
+class _RetryingTransport(httpx.HTTPTransport):
+    """HTTP transport that retries a request once when a pooled keep-alive connection
+    turns out to have been closed by the server (or the pooler) in the meantime."""
+
+    def handle_request(self, request):
+        try:
+            return super().handle_request(request)
+        except httpx.RemoteProtocolError:
+            logging.warning("Supabase connection was dropped, retrying on a new one.")
+            return super().handle_request(request)
+
+
+def create_supabase_client(supabase_url, supabase_key):
+    """Creates the Supabase client used by the whole process.
+    Every PostgREST call shares one bounded pool of keep-alive connections, so
+    requests skip the TCP/TLS handshake and a burst of bots cannot open more than
+    DB_MAX_CONNECTIONS connections per worker. supabase-py ignores its own
+    PostgREST timeout when given an httpx client, so DB_TIMEOUT_SECONDS is set here;
+    without it every call would use httpx's 5 second default.
+
+    @param supabase_url: The Supabase project URL.
+    @param supabase_key: The Supabase API key.
+    @return: The Supabase client.
+    """
+    limits = httpx.Limits(
+        max_connections=CONFIG["DB_MAX_CONNECTIONS"],
+        max_keepalive_connections=CONFIG["DB_MAX_CONNECTIONS"],
+        keepalive_expiry=CONFIG["DB_KEEPALIVE_SECONDS"],
+    )
+    http_client = httpx.Client(
+        transport=_RetryingTransport(limits=limits),
+        timeout=CONFIG["DB_TIMEOUT_SECONDS"],
+    )
+    return create_client(
+        supabase_url, supabase_key, options=ClientOptions(httpx_client=http_client)
+    )
+
+
+@lru_cache(maxsize=4096)
 def get_bot_name(user_agent_string: str) -> str | None:
     """    Extracts the bot name from the user agent string if it is a bot.
     Returns the bot name or None if not a bot.
+    Results are memoized per user agent string, since each crawler repeats its
+    user agent on every visit; use get_bot_name.cache_info() to inspect hit rates.
 
     @param user_agent_string: The user agent string from the request headers.
     @return: The bot name if detected, otherwise None.
     """
-
     user_agent = parse(user_agent_string)
     if user_agent.is_bot:
         return user_agent.browser.family
     return None
 
 
-def create_new_bot_entry(bot_name: str) -> tuple[int, int]:
+""" Bots whose database lookup is in progress, mapped to an event set once it finishes,
+so concurrent requests from one new bot share a single query and insert."""
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def _bot_cache_get(bot_name):
+    """Returns the cached (template ID, seed) for a bot, or None if it is missing or
+    expired, and marks it as recently used."""
+    with BOT_CACHE_LOCK:
+        cached = BOT_CACHE.get(bot_name)
+        if cached is None:
+            return None
+        expires_at, entry = cached
+        if time.monotonic() >= expires_at:
+            del BOT_CACHE[bot_name]
+            return None
+        BOT_CACHE.move_to_end(bot_name)
+        return entry
+
+
+def _bot_cache_put(bot_name, entry):
+    """Caches a bot's (template ID, seed), evicting the least recently used bots
+    past BOT_CACHE_SIZE."""
+    expires_at = time.monotonic() + CONFIG["BOT_CACHE_TTL_SECONDS"]
+    with BOT_CACHE_LOCK:
+        BOT_CACHE[bot_name] = (expires_at, entry)
+        BOT_CACHE.move_to_end(bot_name)
+        while len(BOT_CACHE) > CONFIG["BOT_CACHE_SIZE"]:
+            BOT_CACHE.popitem(last=False)
+
+
+def _bot_cache_load(bot_name, entry):
+    """Stores a preloaded bot's (template ID, seed) without changing how recently bots
+    were used. A cached bot is updated in place, and a new one is added as the least
+    recently used only while BOT_CACHE has room, so a reload never evicts active bots.
+
+    @param bot_name: The name of the bot.
+    @param entry: The bot's (template ID, seed).
+    @return: True if the bot was stored, False if BOT_CACHE was full.
     """
-    Creates a new entry for a bot in the database with a random template ID and seed.
-    If the bot is new, it assigns a completely random template ID and seed.
-    This function also updates the BOT_CACHE with the new template ID and seed.
-    Raises an exception if the Supabase client is not initialized or if the insert fails.
-    
-    @param bot_name: The name of the bot to create an entry for.
-    @return: A tuple containing the new template ID and seed.
-    """
-    logging.info(
-        f"'{bot_name}' is a new bot. Assigning a completely random template and seed."
-    )
+    expires_at = time.monotonic() + CONFIG["BOT_CACHE_TTL_SECONDS"]
+    with BOT_CACHE_LOCK:
+        if bot_name in BOT_CACHE:
+            BOT_CACHE[bot_name] = (expires_at, entry)
+        elif len(BOT_CACHE) < CONFIG["BOT_CACHE_SIZE"]:
+            BOT_CACHE[bot_name] = (expires_at, entry)
+            BOT_CACHE.move_to_end(bot_name, last=False)
+        else:
+            return False
+    return True
 
-    # Generate a random template ID and seed
-    new_template_id = random.randint(1, CONFIG["TOTAL_TEMPLATES"])
-    new_seed = random.randint(1, 2**31 - 1)
-    logging.info(
-        f"Randomly assigned template ID {new_template_id} and seed {new_seed} to '{bot_name}'."
-    )
 
-    # Check if Supabase client is initialized
+def preload_bot_cache():
+    """Loads every known bot's template ID and seed into BOT_CACHE with bulk SELECTs,
+    so bots seen before a restart, or by another worker, are served from memory.
+    Rows are fetched a page at a time until an empty page, up to BOT_CACHE_SIZE bots;
+    the server may return fewer rows per page than asked for (PostgREST max_rows).
+    Rows without a seed are skipped, so their first lookup goes through
+    get_or_create_bot, which fills it in.
+
+    @return: The number of bots loaded.
+    """
     if supabase is None:
-        raise Exception(
-            "Supabase client is not initialized. Cannot save new bot entry."
+        logging.error("Supabase client is not initialized. Cannot preload BOT_CACHE.")
+        return 0
+
+    page_size = 1000
+    entries = []
+    start = 0
+    while len(entries) < CONFIG["BOT_CACHE_SIZE"]:
+        rows = (
+            supabase.table("bot_visits")
+            .select("bot_name", "template_id", "seed")
+            .order("bot_name")
+            .range(start, start + page_size - 1)
+            .execute()
+            .data
         )
-
-    # Insert the new bot entry into the database
-    insert_response = (
-        supabase.table("bot_visits")
-        .insert(
-            {"bot_name": bot_name, "template_id": new_template_id, "seed": new_seed}
+        entries.extend(
+            (row["bot_name"], (row["template_id"], row["seed"]))
+            for row in rows
+            if row["seed"]
         )
-        .execute()
+        if not rows:
+            break
+        start += len(rows)
+
+    loaded = sum(
+        _bot_cache_load(bot_name, entry)
+        for bot_name, entry in entries[: CONFIG["BOT_CACHE_SIZE"]]
     )
+    logging.info("Preloaded %d bots into BOT_CACHE.", loaded)
+    return loaded
+
+
+def _bot_cache_refresh_loop():
+    """Background loop that loads BOT_CACHE and then reloads it every
+    CACHE_DURATION_SECONDS, picking up bots that other workers or instances have added."""
+    while True:
+        try:
+            preload_bot_cache()
+        except Exception:
+            logging.exception("Failed to refresh BOT_CACHE from the database")
+        time.sleep(CONFIG["CACHE_DURATION_SECONDS"])
+
 
-    if not insert_response.data:
-        raise Exception(f"Failed to save new bot '{bot_name}' to Supabase.")
-    return new_template_id, new_seed
+""" The process that started the BOT_CACHE refresh thread. Threads do not survive a
+fork, so a gunicorn worker forked from a preloaded master starts its own."""
+_BOT_CACHE_REFRESH_PID = None
+_BOT_CACHE_REFRESH_LOCK = threading.Lock()
+
+
+def start_bot_cache_refresh():
+    """Starts the thread that preloads BOT_CACHE and keeps refreshing it, once per
+    process. The preload runs in the thread, so the calling request does not wait."""
+    global _BOT_CACHE_REFRESH_PID
+    pid = os.getpid()
+    if pid == _BOT_CACHE_REFRESH_PID or supabase is None:
+        return
+    with _BOT_CACHE_REFRESH_LOCK:
+        if pid == _BOT_CACHE_REFRESH_PID:
+            return
+        _BOT_CACHE_REFRESH_PID = pid
+        threading.Thread(target=_bot_cache_refresh_loop, daemon=True).start()
 
 
 def get_or_create_bot_template_id(bot_name: str) -> tuple[int, int]:
@@ -861,59 +1326,145 @@ def get_or_create_bot_template_id(bot_name: str) -> tuple[int, int]:
     This function first checks the BOT_CACHE for a cached entry. If found, it returns the cached values.
     If not found in the cache, it queries the database for the bot's template ID and seed.
     If the bot is new, it creates a new entry in the database and updates the cache.
+    Concurrent requests from the same new bot wait for the first one's lookup instead of
+    each querying and inserting.
     Raises an exception if the Supabase client is not initialized or if the query/update fails.
     
     
     @param bot_name: The name of the bot to get or create a template ID and seed for.
     @return: A tuple containing the template ID and seed for the bot.
     """
-    if (
-        bot_name in BOT_CACHE
-        and (time.time() - BOT_CACHE[bot_name]["timestamp"])
-        < CONFIG["CACHE_DURATION_SECONDS"]
-    ):
-        logging.info(f"'{bot_name}' found in cache. Serving cached template and seed.")
-        cache = BOT_CACHE[bot_name]
-        return cache["template_id"], cache["seed"]
+    start_bot_cache_refresh()
+    while True:
+        cached = _bot_cache_get(bot_name)
+        if cached is not None:
+            logging.info(
+                "'%s' found in cache. Serving cached template and seed.", bot_name
+            )
+            return cached
+
+        with _INFLIGHT_LOCK:
+            event = _INFLIGHT.get(bot_name)
+            if event is None:
+                event = _INFLIGHT[bot_name] = threading.Event()
+                is_leader = True
+            else:
+                is_leader = False
+        if not is_leader:
+            # Another thread is already looking this bot up; reuse its result
+            event.wait()
+            continue
+
+        try:
+            return _lookup_or_create_bot(bot_name)
+        finally:
+            with _INFLIGHT_LOCK:
+                del _INFLIGHT[bot_name]
+            event.set()
+
+
+""" PostgREST error codes meaning schema.sql has not been run yet: PGRST202 when the
+get_or_create_bot function does not exist, 42P10 when the bot_name unique constraint it
+relies on is missing."""
+_SCHEMA_MISSING_CODES = frozenset({"PGRST202", "42P10"})
+
+
+def _lookup_or_create_bot(bot_name: str) -> tuple[int, int]:
+    """
+    Queries the database for a bot's template ID and seed, creating a new entry if the
+    bot is unknown, and caches the result. Only one thread per bot runs this at a time.
+    Falls back to _select_or_insert_bot until schema.sql has been run.
+
+    @param bot_name: The name of the bot to get or create a template ID and seed for.
+    @return: A tuple containing the template ID and seed for the bot.
+    """
     try:
         if supabase is None:
             raise Exception(
                 "Supabase client is not initialized. Cannot query bot template ID."
             )
 
-        response = (
-            supabase.table("bot_visits")
-            .select("template_id", "seed")
-            .eq("bot_name", bot_name)
-            .execute()
-        )
-        if response.data:
-            template_id = response.data[0]["template_id"]
-            seed = response.data[0].get("seed")
-            if not seed:
-                # If seed is missing (old entry), generate and update it
-                seed = random.randint(1, 2**31 - 1)
-                supabase.table("bot_visits").update({"seed": seed}).eq(
-                    "bot_name", bot_name
-                ).execute()
-            logging.info(
-                f"'{bot_name}' is a returning bot. Found template: {template_id}, seed: {seed} in DB."
+        try:
+            # Returns the bot's row, inserting one with a random template and seed for
+            # a new bot (or filling in a missing seed), in a single round-trip
+            response = supabase.rpc(
+                "get_or_create_bot",
+                {"p_name": bot_name, "p_template_count": _TOTAL_TEMPLATES},
+            ).execute()
+        except PostgrestAPIError as e:
+            if e.code not in _SCHEMA_MISSING_CODES:
+                raise
+            logging.warning(
+                "get_or_create_bot is unavailable (%s: %s); run schema.sql. "
+                "Falling back to a separate SELECT and INSERT.",
+                e.code,
+                e.message,
             )
+            template_id, seed = _select_or_insert_bot(bot_name)
         else:
-            template_id, seed = create_new_bot_entry(bot_name)
-        BOT_CACHE[bot_name] = {
-            "template_id": template_id,
-            "seed": seed,
-            "timestamp": time.time(),
-        }
+            if not response.data:
+                raise Exception("get_or_create_bot returned no row.")
+            template_id = response.data[0]["template_id"]
+            seed = response.data[0]["seed"]
+        logging.info(
+            "Serving '%s' template: %d, seed: %d from DB.",
+            bot_name,
+            template_id,
+            seed,
+        )
+        _bot_cache_put(bot_name, (template_id, seed))
         return template_id, seed
-    except Exception as e:
-        print(f"Error #2")
-        traceback.print_exc()
-        logging.error(f"Database query/update failed for bot '{bot_name}': {e}")
+    except Exception:
+        logging.exception("Database query/update failed for bot '%s'", bot_name)
         raise
 
 
+def _select_or_insert_bot(bot_name: str) -> tuple[int, int]:
+    """
+    Looks a bot up with a SELECT and inserts a row with a random template ID and seed if
+    it is new, filling in the seed of older rows that have none. This is the lookup from
+    before get_or_create_bot, kept for databases that schema.sql has not been run on.
+    Two workers seeing the same new bot at once can both insert it.
+
+    @param bot_name: The name of the bot to get or create a template ID and seed for.
+    @return: A tuple containing the template ID and seed for the bot.
+    """
+    if supabase is None:
+        raise Exception(
+            "Supabase client is not initialized. Cannot query bot template ID."
+        )
+
+    response = (
+        supabase.table("bot_visits")
+        .select("template_id", "seed")
+        .eq("bot_name", bot_name)
+        .execute()
+    )
+    if response.data:
+        template_id = response.data[0]["template_id"]
+        seed = response.data[0].get("seed")
+        if not seed:
+            # Older rows have no seed, so generate and store one
+            seed = random.randint(1, 2**31 - 1)
+            supabase.table("bot_visits").update({"seed": seed}).eq(
+                "bot_name", bot_name
+            ).execute()
+        return template_id, seed
+
+    template_id = random.randint(1, _TOTAL_TEMPLATES)
+    seed = random.randint(1, 2**31 - 1)
+    logging.info(
+        "'%s' is a new bot. Assigning template ID %d and seed %d.",
+        bot_name,
+        template_id,
+        seed,
+    )
+    supabase.table("bot_visits").insert(
+        {"bot_name": bot_name, "template_id": template_id, "seed": seed}
+    ).execute()
+    return template_id, seed
+
+
 # --- Flask Application Routes ---
 app = Flask(__name__)
 
@@ -932,25 +1483,37 @@ def serve_content():
     # If a bot is detected, generate the page for the bot
     # If no bot is detected, serve the default index.html page
     if bot_name:
-        logging.info(f"Bot detected: '{bot_name}'")
+        logging.info("Bot detected: '%s'", bot_name)
         if not nested_sections:
             logging.error(
-                f"Cannot serve '{bot_name}' because FakeData.html was not parsed."
+                "Cannot serve '%s' because FakeData.html was not parsed.", bot_name
             )
             abort(500, description="Server content source is not available.")
         try:
             template_id, seed = get_or_create_bot_template_id(bot_name)
             logging.info(
-                f"Serving template {template_id} with seed {seed} for bot '{bot_name}'"
+                "Serving template %d with seed %d for bot '%s'",
+                template_id,
+                seed,
+                bot_name,
             )
-            html_content = generate_page_for_bot(template_id, seed)
-            return Response(html_content, mimetype="text/html")
-
-        except Exception as e:
-            print(f"Error #3")
-            traceback.print_exc()
+            etag = bot_page_etag(template_id, seed)
+            if etag is not None and request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                html_content = generate_page_for_bot(template_id, seed)
+                response = Response(html_content, mimetype="text/html")
+            if etag is not None:
+                response.set_etag(etag)
+                response.cache_control.public = True
+                response.cache_control.max_age = _PAGE_MAX_AGE_SECONDS
+                # Humans get a different page at the same URL
+                response.vary.add("User-Agent")
+            return response
+
+        except Exception:
             logging.critical(
-                f"A critical error occurred while processing bot request: {e}"
+                "A critical error occurred while processing bot request", exc_info=True
             )
             abort(500, description="A server error occurred.")
     else:
@@ -958,37 +1521,42 @@ def serve_content():
         return render_template("index.html")
 
 
-if __name__ == "__main__":
-    # --- HTML Parsing at Startup ---
-    nested_sections = {}
-    try:
-        with open("FakeData.html", "r", encoding="utf-8") as f:
-            html_content = f.read()
-        nested_sections = parse_master_html(html_content)
-        logging.info(
-            f"Successfully parsed FakeData.html into {len(nested_sections)} top-level sections."
-        )
-    except FileNotFoundError:
-        print(f"Error #4")
-        traceback.print_exc()
-        logging.error(
-            "CRITICAL: FakeData.html not found. The application cannot serve bot content."
-        )
-    except Exception as e:
-        print(f"Error #5")
-        traceback.print_exc()
-        logging.error(f"CRITICAL: Failed to parse FakeData.html: {e}")
-
-    # --- Supabase Client Initialization ---
-
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_KEY")
-    if not supabase_url or not supabase_key:
-        logging.error("Supabase URL and Key must be set.")
-        supabase = None
-    else:
-        supabase = create_client(supabase_url, supabase_key)
+# --- HTML Parsing at Startup ---
+""" FakeData.html is parsed once at import time so every request reuses the same structure.
+PREPARED_TEMPLATES holds every template number resolved against it."""
+nested_sections = {}
+PREPARED_TEMPLATES: tuple[PreparedTemplate, ...] = ()
+try:
+    nested_sections = load_nested_sections("FakeData.html")
+    PREPARED_TEMPLATES = prepare_templates(nested_sections)
+    _generate_page_for_bot_cached.cache_clear()
+    _bot_page_etag_cached.cache_clear()
+    logging.info(
+        "Successfully parsed FakeData.html into %d top-level sections.",
+        len(nested_sections),
+    )
+except FileNotFoundError:
+    logging.error(
+        "CRITICAL: FakeData.html not found. The application cannot serve bot content."
+    )
+except Exception:
+    logging.exception("CRITICAL: Failed to parse FakeData.html")
+
+
+# --- Supabase Client Initialization ---
+""" Created at import, like the parsed templates, so the client also exists when a
+WSGI server such as gunicorn imports main:app. No connection is opened until the
+first query, which keeps the module safe to load before workers fork (--preload)."""
+supabase_url = os.environ.get("SUPABASE_URL")
+supabase_key = os.environ.get("SUPABASE_KEY")
+if not supabase_url or not supabase_key:
+    logging.error("Supabase URL and Key must be set.")
+    supabase = None
+else:
+    supabase = create_supabase_client(supabase_url, supabase_key)
 
+
+if __name__ == "__main__":
     # --- Main Application Route (Unchanged) ---
 
     app.run(host="0.0.0.0", port=8081)
@@ -0,0 +1,32 @@
+-- Database changes required by main.py, run in the Supabase SQL editor
+-- before deploying (see the README). Until then main.py falls back to a
+-- separate SELECT and INSERT per uncached bot.
+
+-- Each bot has a single bot_visits row. get_or_create_bot relies on this
+-- constraint for its on conflict clause.
+-- Remove any duplicate bot_name rows before adding it, for example with this,
+-- which keeps one row of each bot:
+--   delete from bot_visits a using bot_visits b
+--   where a.bot_name = b.bot_name and a.ctid > b.ctid;
+alter table bot_visits
+    add constraint bot_visits_bot_name_key unique (bot_name);
+
+-- Returns a bot's template and seed, first inserting a row with a random
+-- template (1..p_template_count) and seed for a bot that has none yet.
+-- Older rows without a seed get the generated one filled in.
+-- main.py calls it through supabase.rpc("get_or_create_bot", ...), so a
+-- cache miss costs one round-trip whether or not the bot is new.
+create or replace function get_or_create_bot(p_name text, p_template_count integer)
+returns table (template_id integer, seed bigint)
+language sql
+as $$
+    insert into bot_visits (bot_name, template_id, seed)
+    values (
+        p_name,
+        floor(random() * p_template_count)::integer + 1,
+        floor(random() * 2147483647)::integer + 1
+    )
+    on conflict (bot_name) do update
+        set seed = coalesce(nullif(bot_visits.seed, 0), excluded.seed)
+    returning bot_visits.template_id::integer, bot_visits.seed::bigint;
+$$;
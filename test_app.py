@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+# Ensure the main module is importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+BOT_UA = "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+HUMAN_UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+@pytest.fixture
+def bot_template(monkeypatch):
+    # Stands in for the Supabase lookup; tests set the (template_id, seed) to serve
+    assignment = {"value": (3, 42)}
+    monkeypatch.setattr(main, "get_or_create_bot_template_id", lambda _bot_name: assignment["value"])
+    return assignment
+
+@pytest.mark.usefixtures("bot_template")
+def test_bot_page_is_cacheable(client):
+    response = client.get("/", headers={"User-Agent": BOT_UA})
+    assert response.status_code == 200
+    assert response.data == main.generate_page_for_bot(3, 42)
+    assert response.headers["ETag"]
+    assert "User-Agent" in response.vary
+    assert response.cache_control.public
+    assert response.cache_control.max_age == main.CONFIG["PAGE_MAX_AGE_SECONDS"]
+
+@pytest.mark.parametrize("weak", [False, True])
+@pytest.mark.usefixtures("bot_template")
+def test_bot_page_revalidates(client, weak):
+    etag = client.get("/", headers={"User-Agent": BOT_UA}).headers["ETag"]
+    if weak:
+        # gzip in front of the app rewrites strong tags to weak ones
+        etag = "W/" + etag
+    response = client.get("/", headers={"User-Agent": BOT_UA, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"]
+    assert "User-Agent" in response.vary
+
+def test_changed_page_is_served_again(client, bot_template):
+    etag = client.get("/", headers={"User-Agent": BOT_UA}).headers["ETag"]
+    bot_template["value"] = (3, 43)
+    response = client.get("/", headers={"User-Agent": BOT_UA, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_random_seed_page_is_not_cacheable(client, bot_template):
+    bot_template["value"] = (3, 0)
+    response = client.get("/", headers={"User-Agent": BOT_UA})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert not response.cache_control.public
+
+@pytest.mark.usefixtures("bot_template")
+def test_human_gets_index_page(client):
+    response = client.get("/", headers={"User-Agent": HUMAN_UA})
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    with main.app.app_context():
+        assert response.get_data(as_text=True) == main.render_template("index.html")
+
+@pytest.mark.parametrize("template_id", [0, 16])
+def test_invalid_template_is_an_error(client, bot_template, template_id):
+    # Template 0 used to wrap around to template 15 and match its tag
+    bot_template["value"] = (15, 42)
+    etag = client.get("/", headers={"User-Agent": BOT_UA}).headers["ETag"]
+    bot_template["value"] = (template_id, 42)
+    for headers in ({}, {"If-None-Match": etag}):
+        response = client.get("/", headers={"User-Agent": BOT_UA, **headers})
+        assert response.status_code == 500
+    with pytest.raises(ValueError):
+        main.bot_page_etag(template_id, 42)
+    with pytest.raises(ValueError):
+        main.generate_page_for_bot(template_id, 42)
@@ -0,0 +1,282 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+# Ensure the main module is importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from supabase import PostgrestAPIError
+
+import main
+
+
+class FakeQuery:
+    """Just enough of the supabase-py query builder for preload_bot_cache. Like
+    PostgREST with max_rows set, it returns at most max_rows rows per request."""
+
+    def __init__(self, rows, max_rows):
+        self.rows = rows
+        self.max_rows = max_rows
+        self.requests = []
+
+    def table(self, name):
+        assert name == "bot_visits"
+        return self
+
+    def select(self, *_columns):
+        return self
+
+    def order(self, column):
+        assert column == "bot_name"
+        return self
+
+    def range(self, start, end):
+        self.requests.append((start, end))
+        self.data = self.rows[start : min(end + 1, start + self.max_rows)]
+        return self
+
+    def execute(self):
+        return self
+
+class FakeBotDatabase:
+    """Just enough of the supabase-py client for _lookup_or_create_bot, backed by a
+    dict of bot name to (template_id, seed). With has_schema=False the RPC fails the
+    way PostgREST reports a missing function, as before schema.sql is run. If gate
+    is set, RPCs wait for it before answering, and the first `failures` RPCs fail."""
+
+    def __init__(self, bots=None, has_schema=True, gate=None, failures=0):
+        self.bots = dict(bots or {})
+        self.has_schema = has_schema
+        self.gate = gate
+        self.failures = failures
+        self.requests = []
+
+    def rpc(self, name, params):
+        assert name == "get_or_create_bot"
+        self.operation, self.bot_name = "rpc", params["p_name"]
+        return self
+
+    def table(self, name):
+        assert name == "bot_visits"
+        return self
+
+    def select(self, *_columns):
+        self.operation = "select"
+        return self
+
+    def insert(self, row):
+        self.operation, self.bot_name, self.values = "insert", row["bot_name"], row
+        return self
+
+    def update(self, values):
+        self.operation, self.values = "update", values
+        return self
+
+    def eq(self, column, value):
+        assert column == "bot_name"
+        self.bot_name = value
+        return self
+
+    def execute(self):
+        self.requests.append(self.operation)
+        if self.operation == "rpc":
+            if self.gate is not None:
+                self.gate.wait()
+            if self.failures:
+                self.failures -= 1
+                raise PostgrestAPIError({"code": "57014", "message": "query timed out"})
+            if not self.has_schema:
+                raise PostgrestAPIError(
+                    {"code": "PGRST202", "message": "Could not find the function"}
+                )
+            template_id, seed = self.bots.setdefault(self.bot_name, (5, 55))
+            self.data = [{"template_id": template_id, "seed": seed}]
+        elif self.operation == "select":
+            self.data = [
+                {"template_id": template_id, "seed": seed}
+                for name, (template_id, seed) in self.bots.items()
+                if name == self.bot_name
+            ]
+        elif self.operation == "insert":
+            self.bots[self.bot_name] = (self.values["template_id"], self.values["seed"])
+            self.data = [self.values]
+        else:
+            template_id, _ = self.bots[self.bot_name]
+            self.bots[self.bot_name] = (template_id, self.values["seed"])
+            self.data = []
+        return self
+
+def make_rows(count):
+    return [
+        {"bot_name": f"bot{i:05d}", "template_id": i % 15 + 1, "seed": i + 1}
+        for i in range(count)
+    ]
+
+@pytest.fixture
+def bot_cache(monkeypatch):
+    cache = OrderedDict()
+    monkeypatch.setattr(main, "BOT_CACHE", cache)
+    monkeypatch.setitem(main.CONFIG, "BOT_CACHE_SIZE", 10000)
+    return cache
+
+@pytest.fixture
+def no_refresh_thread(monkeypatch):
+    # Pretend this process already runs the BOT_CACHE refresh
+    monkeypatch.setattr(main, "_BOT_CACHE_REFRESH_PID", os.getpid())
+
+def test_preload_pages_past_server_row_limit(monkeypatch, bot_cache):
+    fake = FakeQuery(make_rows(2500), max_rows=100)
+    monkeypatch.setattr(main, "supabase", fake)
+    assert main.preload_bot_cache() == 2500
+    assert len(bot_cache) == 2500
+    assert main._bot_cache_get("bot02499") == (2499 % 15 + 1, 2500)
+    # 25 full pages, then an empty one
+    assert len(fake.requests) == 26
+
+def test_preload_skips_rows_without_seed(monkeypatch, bot_cache):
+    rows = make_rows(3)
+    rows[1]["seed"] = None
+    monkeypatch.setattr(main, "supabase", FakeQuery(rows, max_rows=1000))
+    assert main.preload_bot_cache() == 2
+    assert "bot00001" not in bot_cache
+
+def test_preload_keeps_recency(monkeypatch, bot_cache):
+    monkeypatch.setattr(main, "supabase", FakeQuery(make_rows(5), max_rows=1000))
+    main._bot_cache_put("bot00003", (1, 1))
+    main._bot_cache_put("bot00000", (1, 1))
+    main.preload_bot_cache()
+    # Cached bots stay the most recently used and get the stored values
+    assert list(bot_cache)[-2:] == ["bot00003", "bot00000"]
+    assert bot_cache["bot00003"][1] == (4, 4)
+    main.preload_bot_cache()
+    assert list(bot_cache)[-2:] == ["bot00003", "bot00000"]
+
+def test_preload_does_not_evict_active_bots(monkeypatch, bot_cache):
+    monkeypatch.setitem(main.CONFIG, "BOT_CACHE_SIZE", 3)
+    monkeypatch.setattr(main, "supabase", FakeQuery(make_rows(5), max_rows=1000))
+    main._bot_cache_put("active", (2, 9))
+    assert main.preload_bot_cache() == 2
+    assert "active" in bot_cache
+    assert len(bot_cache) == 3
+
+@pytest.mark.usefixtures("bot_cache", "no_refresh_thread")
+def test_lookup_uses_rpc(monkeypatch):
+    database = FakeBotDatabase({"Googlebot": (3, 42)})
+    monkeypatch.setattr(main, "supabase", database)
+    assert main.get_or_create_bot_template_id("Googlebot") == (3, 42)
+    assert main.get_or_create_bot_template_id("Googlebot") == (3, 42)
+    assert database.requests == ["rpc"]
+
+@pytest.mark.usefixtures("bot_cache", "no_refresh_thread")
+def test_lookup_falls_back_without_schema(monkeypatch):
+    database = FakeBotDatabase({"Oldbot": (2, None)}, has_schema=False)
+    monkeypatch.setattr(main, "supabase", database)
+    template_id, seed = main.get_or_create_bot_template_id("Newbot")
+    assert database.bots["Newbot"] == (template_id, seed)
+    assert 1 <= template_id <= main.CONFIG["TOTAL_TEMPLATES"]
+    # Rows stored without a seed get one filled in
+    template_id, seed = main.get_or_create_bot_template_id("Oldbot")
+    assert template_id == 2 and seed
+    assert database.bots["Oldbot"] == (2, seed)
+    assert database.requests == ["rpc", "select", "insert", "rpc", "select", "update"]
+
+@pytest.mark.usefixtures("no_refresh_thread")
+def test_lookup_raises_other_database_errors(monkeypatch, bot_cache):
+    database = FakeBotDatabase()
+    def execute():
+        raise PostgrestAPIError({"code": "42501", "message": "permission denied"})
+    monkeypatch.setattr(database, "execute", execute)
+    monkeypatch.setattr(main, "supabase", database)
+    with pytest.raises(PostgrestAPIError):
+        main.get_or_create_bot_template_id("Googlebot")
+    assert "Googlebot" not in bot_cache
+
+def lookup_in_threads(bot_name, count):
+    """Runs get_or_create_bot_template_id for one bot from `count` threads at once.
+
+    @return: The results and the exceptions raised, one list each.
+    """
+    results, errors = [], []
+    def lookup():
+        try:
+            results.append(main.get_or_create_bot_template_id(bot_name))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=lookup) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+@pytest.mark.usefixtures("bot_cache", "no_refresh_thread")
+def test_concurrent_misses_share_one_lookup(monkeypatch):
+    gate = threading.Event()
+    database = FakeBotDatabase({"Googlebot": (3, 42)}, gate=gate)
+    monkeypatch.setattr(main, "supabase", database)
+    threads, results, errors = lookup_in_threads("Googlebot", 20)
+    # Give every thread time to miss the cache and queue up behind the first
+    time.sleep(0.2)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert results == [(3, 42)] * 20
+    assert database.requests == ["rpc"]
+    assert main._INFLIGHT == {}
+
+@pytest.mark.usefixtures("bot_cache", "no_refresh_thread")
+def test_failed_lookup_hands_over_to_a_waiter(monkeypatch):
+    gate = threading.Event()
+    database = FakeBotDatabase({"Googlebot": (3, 42)}, gate=gate, failures=1)
+    monkeypatch.setattr(main, "supabase", database)
+    threads, results, errors = lookup_in_threads("Googlebot", 2)
+    time.sleep(0.2)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    # The first thread's RPC fails; the waiting thread retries instead of failing too
+    assert len(errors) == 1 and isinstance(errors[0], PostgrestAPIError)
+    assert results == [(3, 42)]
+    assert database.requests == ["rpc", "rpc"]
+    assert main._INFLIGHT == {}
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Replaces time.monotonic so tests can move past BOT_CACHE_TTL_SECONDS
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    return now
+
+def test_cache_entry_expires(bot_cache, clock):
+    main._bot_cache_put("Googlebot", (3, 42))
+    clock[0] += main.CONFIG["BOT_CACHE_TTL_SECONDS"] - 1
+    assert main._bot_cache_get("Googlebot") == (3, 42)
+    clock[0] += 1
+    assert main._bot_cache_get("Googlebot") is None
+    assert "Googlebot" not in bot_cache
+
+@pytest.mark.usefixtures("bot_cache", "no_refresh_thread")
+def test_expired_bot_is_looked_up_again(monkeypatch, clock):
+    database = FakeBotDatabase({"Googlebot": (3, 42)})
+    monkeypatch.setattr(main, "supabase", database)
+    main.get_or_create_bot_template_id("Googlebot")
+    main.get_or_create_bot_template_id("Googlebot")
+    clock[0] += main.CONFIG["BOT_CACHE_TTL_SECONDS"]
+    assert main.get_or_create_bot_template_id("Googlebot") == (3, 42)
+    assert database.requests == ["rpc", "rpc"]
+
+def test_cache_evicts_least_recently_used(monkeypatch, bot_cache):
+    monkeypatch.setitem(main.CONFIG, "BOT_CACHE_SIZE", 3)
+    for name in ("a", "b", "c"):
+        main._bot_cache_put(name, (1, 1))
+    # Reading "a" makes "b" the least recently used
+    main._bot_cache_get("a")
+    main._bot_cache_put("d", (1, 1))
+    assert list(bot_cache) == ["c", "a", "d"]
+    # Storing an existing bot again also counts as a use
+    main._bot_cache_put("c", (2, 2))
+    main._bot_cache_put("e", (1, 1))
+    assert list(bot_cache) == ["d", "c", "e"]
@@ -3,28 +3,45 @@ import os
 import random
 import argparse
 
+import pytest
+from freezegun import freeze_time
+
 # Ensure the main module is importable
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import main
 from main import (
     CONFIG,
     generate_complete_template,
-    parse_master_html,
+    generate_page_for_bot,
+    load_nested_sections,
 )
 
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+# Faker picks dates up to today, so snapshots are rendered on a fixed day
+SNAPSHOT_DATE = "2025-01-01"
+SNAPSHOT_PAGES = [(1, 1), (3, 42), (8, 12345), (11, 7), (15, 2**31 - 1)]
+
 def load_templates_from_html(html_path="FakeData.html"):
-    with open(html_path, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    nested_sections = parse_master_html(html_content)
-    # Convert nested_sections to a list of templates (h1, h2, content)
-    templates = []
-    for h1, h2s in nested_sections.items():
-        if isinstance(h2s, dict):
-            for h2, content in h2s.items():
-                templates.append((h1, h2, str(content)))
-        else:
-            templates.append((h1, str(h2s)))
-    return templates
+    # generate_complete_template takes the nested H1 -> H2 dictionary as is
+    return load_nested_sections(html_path)
+
+def snapshot_path(template_number, seed):
+    return os.path.join(SNAPSHOT_DIR, f"template{template_number}_seed{seed}.html")
+
+def clear_render_caches():
+    main._fake_tuple.cache_clear()
+    main._generate_page_for_bot_cached.cache_clear()
+    main._bot_page_etag_cached.cache_clear()
+
+def render_snapshot(template_number, seed):
+    # Memoized fake data may have been generated on another day
+    clear_render_caches()
+    try:
+        with freeze_time(SNAPSHOT_DATE):
+            return generate_page_for_bot(template_number, seed).decode("utf-8")
+    finally:
+        clear_render_caches()
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -36,7 +53,9 @@ def run_test(template_number, templates, seed=None, interactive=False, test_idx=
     try:
         html = generate_complete_template(template_number, templates, seed)
         assert "<h1>" in html, f"Template {template_number} missing <h1>"
-        assert "{" not in html, f"Template {template_number} has unreplaced placeholders"
+        # The page head carries CSS braces, so only the body is checked
+        body = html.split("<body>", 1)[-1]
+        assert "{" not in body, f"Template {template_number} has unreplaced placeholders"
         result = f"Template {template_number} (seed={seed}): PASS"
     except Exception as e:
         result = f"Template {template_number} (seed={seed}): FAIL - {e}"
@@ -51,24 +70,61 @@ def run_test(template_number, templates, seed=None, interactive=False, test_idx=
     else:
         print(result)
 
-def test_comprehensive(templates, start=1, interactive=False):
+def run_comprehensive(templates, start=1, interactive=False):
     total_templates = CONFIG["TOTAL_TEMPLATES"]
     for idx, template_number in enumerate(range(start, total_templates + 1), 1):
         run_test(template_number, templates, interactive=interactive, test_idx=idx, total_tests=total_templates-start+1)
 
-def test_random(templates, count=5, interactive=False):
+def run_random(templates, count=5, interactive=False):
     total_templates = CONFIG["TOTAL_TEMPLATES"]
     for idx in range(1, count + 1):
         template_number = random.randint(1, total_templates)
         run_test(template_number, templates, interactive=interactive, test_idx=idx, total_tests=count)
 
-def test_single(templates, template_number, repeat=1, interactive=False):
+def run_single(templates, template_number, repeat=1, interactive=False):
     for idx in range(1, repeat + 1):
         run_test(template_number, templates, interactive=interactive, test_idx=idx, total_tests=repeat)
 
+def write_snapshots():
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for template_number, seed in SNAPSHOT_PAGES:
+        path = snapshot_path(template_number, seed)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(render_snapshot(template_number, seed))
+        print(f"Wrote {path}")
+
+def test_all_templates_render():
+    templates = load_templates_from_html()
+    for template_number in range(1, CONFIG["TOTAL_TEMPLATES"] + 1):
+        html = generate_complete_template(template_number, templates, 7)
+        assert "<h1>" in html
+        assert "{" not in html.split("<body>", 1)[-1]
+
+def test_same_seed_same_page():
+    templates = load_templates_from_html()
+    first = generate_complete_template(4, templates, 99)
+    assert generate_complete_template(4, templates, 99) == first
+    assert generate_complete_template(4, templates, 100) != first
+
+def test_random_seed_pages_are_not_cached():
+    clear_render_caches()
+    first = generate_page_for_bot(5, 0)
+    assert generate_page_for_bot(5, 0) != first
+    # One-off seeds must not push reusable entries out of the caches
+    assert main._fake_tuple.cache_info().currsize == 0
+    assert main._generate_page_for_bot_cached.cache_info().currsize == 0
+
+@pytest.mark.parametrize("template_number,seed", SNAPSHOT_PAGES)
+def test_page_matches_snapshot(template_number, seed):
+    # A stored (template_id, seed) must keep rendering the same page; if this
+    # change is intended, regenerate with: python test_templates.py --mode snapshot
+    with open(snapshot_path(template_number, seed), encoding="utf-8", newline="") as f:
+        expected = f.read()
+    assert render_snapshot(template_number, seed) == expected
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test all templates for HTML generation.")
-    parser.add_argument("--mode", choices=["comprehensive", "random", "single"], default="comprehensive", help="Test mode")
+    parser.add_argument("--mode", choices=["comprehensive", "random", "single", "snapshot"], default="comprehensive", help="Test mode")
     parser.add_argument("--start", type=int, default=1, help="Start index for comprehensive mode")
     parser.add_argument("--count", type=int, default=5, help="Number of random tests for random mode")
     parser.add_argument("--template", type=int, default=1, help="Template number for single mode")
@@ -80,8 +136,10 @@ if __name__ == "__main__":
     templates = load_templates_from_html(args.html)
 
     if args.mode == "comprehensive":
-        test_comprehensive(templates, start=args.start, interactive=args.interactive)
+        run_comprehensive(templates, start=args.start, interactive=args.interactive)
     elif args.mode == "random":
-        test_random(templates, count=args.count, interactive=args.interactive)
+        run_random(templates, count=args.count, interactive=args.interactive)
     elif args.mode == "single":
-        test_single(templates, template_number=args.template, repeat=args.repeat, interactive=args.interactive)
\ No newline at end of file
+        run_single(templates, template_number=args.template, repeat=args.repeat, interactive=args.interactive)
+    elif args.mode == "snapshot":
+        write_snapshots()
\ No newline at end of file